@@ -3,22 +3,18 @@
 # https://mit-license.org/ . Essentially: do what you want with it, but
 # please do retain this copyright notice.
 
-from datetime import datetime
-import glob
-import hashlib
+import contextlib
+import functools
 import logging
 import os
-import platform
 import re
-import shutil
 import sys
-import shlex
-import subprocess
-import argparse
 import pathlib
-import tempfile
-import time
-from typing import Any
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from datetime import datetime
 
 # Current version - a series of numbers, optionally 'dev' at the end if not-released
 PYSH_VERSION=(0,3,0,)
@@ -48,71 +44,204 @@ def Main(_func, error_mask="PY_ERRORS", ename=None):
         if ename is None or ename == "__main__":
             _func()
     except (KeyboardInterrupt,Exception) as e:
-        if os.getenv(error_mask, "false").lower() == "true":
+        if _env_cached(error_mask, "false").lower() == "true":
             raise
         else:
             print(e)
             exit(1)
 
 
+_ENV_CACHE:dict[str,str|None] = {}
+
+def _env_cached(name, defval=None):
+    """ Environment lookup, reading each variable from the environment only once
+
+    Unset variables are remembered too, and `defval` is applied on every call.
+    See `System.invalidate_env()`
+    """
+    try:
+        value = _ENV_CACHE[name]
+    except KeyError:
+        value = _ENV_CACHE[name] = os.environ.get(name)
+    return defval if value is None else value
+
+
+@functools.lru_cache(maxsize=1)
+def _read_os_info() -> tuple[str,str,str]:
+    import platform
+
+    system = platform.system()
+    plat = system.lower()
+    try:
+        with open("/etc/os-release") as fh:
+            data = {
+                k:v.strip('\n"')
+                for k,sep,v in (line.partition("=") for line in fh)
+                if sep and not k.startswith("#")
+                }
+    except FileNotFoundError:
+        data = None
+
+    if data is not None:
+        return system, data["ID"], data["VERSION_ID"]
+
+    elif plat == "windows":
+        return "Windows", platform.win32_edition(), platform.win32_ver()[0]
+
+    else:
+        raise RuntimeError(f"Unknown system type: {plat}")
+
+
+def _wait_like_system(proc) -> int:
+    """ Wait for a child process the way os.system() does, ignoring SIGINT and SIGQUIT meanwhile
+
+    The child still receives them from the terminal, and its exit code reports the outcome.
+    """
+    import signal
+
+    previous = []
+    try:
+        for sig in (signal.SIGINT, signal.SIGQUIT):
+            previous.append((sig, signal.signal(sig, signal.SIG_IGN)))
+    except ValueError:
+        pass # not in the main thread, signal handlers cannot be changed
+
+    try:
+        return proc.wait()
+    finally:
+        for sig, handler in previous:
+            if handler is not None:
+                signal.signal(sig, handler)
+
+
+_SHELL_SYNTAX = frozenset(";|&$`<>*?[]{}()~!#\n")
+
+# Builtins and keywords of POSIX sh (and common extensions) - some also exist as binaries
+# that behave differently (e.g. `pwd` and symlinked directories, `echo` and escapes)
+_SHELL_BUILTINS = frozenset((
+    ".", ":", "[", "alias", "bg", "break", "cd", "command", "continue", "echo", "eval", "exec",
+    "exit", "export", "false", "fc", "fg", "getopts", "hash", "jobs", "kill", "local", "newgrp",
+    "printf", "pwd", "read", "readonly", "return", "set", "shift", "source", "test", "time",
+    "times", "trap", "true", "type", "ulimit", "umask", "unalias", "unset", "wait",
+    "case", "do", "done", "elif", "else", "esac", "fi", "for", "function", "if", "in", "then",
+    "until", "while",
+    ))
+
 class System:
+    __slots__ = ()
+
     def env(self, name, defval=None):
         """ Get an environment variable
+
+        Each variable is read once and then remembered. If the script changes its own
+        environment, call `invalidate_env()` to see the new values.
         """
-        return os.getenv(name, defval)
+        return _env_cached(name, defval)
+
+
+    def invalidate_env(self, name=None):
+        """ Forget remembered environment variables - only `name` if specified, else all of them
+        """
+        if name is None:
+            _ENV_CACHE.clear()
+        else:
+            _ENV_CACHE.pop(name, None)
 
 
     def shjoin(self, tokens):
         """ Join shell tokens
         """
+        import shlex
         return shlex.join(tokens)
 
 
+    def shsplit(self, command) -> list[str]:
+        """ Split a command string into shell tokens
+
+        Split once outside of a loop, then pass the tokens to `cmd()` on each iteration
+        to avoid re-parsing the same string, e.g.
+
+            tokens = Sys.shsplit("ping -c 1 -W 2")
+            for host in hosts:
+                Sys.cmd(tokens + [host])
+        """
+        import shlex
+        return shlex.split(command)
+
+
     def cmd(self, command, text=True) -> tuple[int, str|bytes, str|bytes]:
         """ Execute a single command subprocess, return the status, stdout and stderr.
 
         Piping is not allowed.
 
+        `command` can be a string, which is split into tokens shell-style, or a list of tokens.
+
         Set `text=True` to return stdout and stderr as strings instead of byte strings
         """
         if isinstance(command, str):
-            command = shlex.split(command)
+            return self.cmd_str(command, text)
+        return self.cmd_argv(command, text)
+
+
+    def cmd_argv(self, argv:list[str], text=True) -> tuple[int, str|bytes, str|bytes]:
+        """ Like `cmd()`, for a command that is already a list of tokens.
+
+        Prefer this when running commands in a loop, it skips any string handling.
+        """
+        import subprocess
 
-        p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        so, se = p.communicate()
+        p = subprocess.run(argv, capture_output=True)
 
         if text is True:
-            so = str(so, 'utf-8')
-            se = str(se, 'utf-8')
+            return p.returncode, p.stdout.decode('utf-8'), p.stderr.decode('utf-8')
 
-        return p.returncode, so, se
+        return p.returncode, p.stdout, p.stderr
+
+
+    def cmd_str(self, command:str, text=True) -> tuple[int, str|bytes, str|bytes]:
+        """ Like `cmd()`, for a command string to split into tokens shell-style.
+        """
+        import shlex
+        return self.cmd_argv(shlex.split(command), text)
 
 
     def shell(self, command) -> int:
         """ Run a shell command. Piping is allowed. Output is not captured.
 
+        Commands that use no shell syntax nor shell builtins are run directly, without spawning
+        an intermediate shell.
+
         Returns the command's exit-code
         """
-        return os.system(command)
+        if os.name == "posix" and not _SHELL_SYNTAX.intersection(command):
+            import shlex
+            import subprocess
+
+            try:
+                tokens = shlex.split(command)
+            except ValueError:
+                tokens = [] # unbalanced quoting, let the shell report it
+
+            if tokens and "=" not in tokens[0] and tokens[0] not in _SHELL_BUILTINS:
+                try:
+                    proc = subprocess.Popen(tokens)
+                except OSError:
+                    pass # not runnable directly (shell builtin, no exec permission...), let the shell handle it
+                else:
+                    return _wait_like_system(proc)
+
+        status = os.system(command)
+        return os.waitstatus_to_exitcode(status) if os.name == "posix" else status
 
 
     def os_info(self) -> tuple[str,str,str]:
         """ Return the platform, operating system name and version as of /etc/hosts (Linux and Unix only)
 
         E.g. ("Linux", "Ubuntu", "24.04") or ("Windows", "Enterprise", "11")
-        """
-        plat = platform.system().lower()
-        if os.path.isfile("/etc/os-release"):
-            with open("/etc/os-release") as fh:
-                lines = [line.split("=", maxsplit=1) for line in fh.readlines()]
-            data = {k:v.strip('\n"') for k,v in lines}
-            return platform.system(), data["ID"], data["VERSION_ID"]
-
-        elif plat == "windows":
-            return "Windows", platform.win32_edition(), platform.win32_ver()[0]
 
-        else:
-            raise RuntimeError(f"Unknown system type: {plat}")
+        The result is computed once per process.
+        """
+        return _read_os_info()
 
 
 
@@ -134,6 +263,8 @@ class Log(_LogBase):
             files = []
         elif isinstance(files, str):
             files = [files]
+        else:
+            files = [f for f in files if f]
 
         def _add_stream(handler:logging.Handler, local_level, **kwargs):
             handler = handler(**kwargs)
@@ -147,12 +278,21 @@ class Log(_LogBase):
         for filepath in files:
             _add_stream(logging.FileHandler, file_level, filename=filepath)
 
+        if not self.handlers:
+            # Nothing requested - stay silent instead of falling back to logging's last-resort stderr handler
+            self.addHandler(logging.NullHandler())
+
 
 class UtilPysh:
-    def date(self, spec:str|None=None) -> datetime:
+    __slots__ = ()
+
+    def date(self, spec:str|None=None) -> 'datetime':
         """ Produce a datetime object. If `spec` is specified, produce an object based on that date-time.
         Else, produce the current date and time object.
 
+        `spec` is an ISO 8601 date/time without a UTC offset, e.g. '2024-01-02 03:04:05.678',
+        '2024-01-02T03:04' or '2024-01-02'. Missing time fields default to zero.
+
         Datetime objects can be compared and subtracted, for effectual temporal math.
 
         e.g.
@@ -162,21 +302,57 @@ class UtilPysh:
             assert (new - old).total_seconds() > 0
             assert (old - new).total_seconds() < 0
         """
+        from datetime import datetime
+
         if spec:
-            assert re.match(r"^\d{4}-\d{2}-\d{2}(T| )\d{2}:\d{2}:\d{2}(\.\d+)?$", spec), (
-                f"Invalid date+time spec: {repr(spec)} ."
-                " Specify time as 'YYYY-MM-DD hh:mm:ss[.msec]'"
-            )
-            return datetime.fromisoformat(spec)
+            try:
+                value = datetime.fromisoformat(spec)
+            except ValueError:
+                value = None
+
+            # Timezone-aware values cannot be compared with or subtracted from naive ones
+            if value is None or value.tzinfo is not None:
+                raise ValueError(
+                    f"Invalid date+time spec: {repr(spec)} ."
+                    " Specify an ISO 8601 date/time without a UTC offset, e.g. 'YYYY-MM-DD hh:mm:ss[.msec]'"
+                )
+            return value
         else:
             return datetime.now()
 
 
-    def hash(self, hashalgo=hashlib.sha1, data:bytes|None=None):
+    def hash(self, hashalgo=None, data:bytes|None=None, path:str|None=None):
         """ Produce a hash of supplied data. If data is literal `None`, then a basic hash based on system time is produced.
 
+        If `path` is specified, the contents of that file are hashed instead. Regular files are memory-mapped
+        rather than read into memory, anything else is streamed through `hashlib.file_digest()`.
+        Specifying both `data` and `path` raises ValueError.
+
         Default hash is sha1. Find other has functions from `hashlib` in the Python standard library.
         """
+        import hashlib
+
+        if data is not None and path is not None:
+            raise ValueError("Specify either data or path to hash, not both")
+
+        if hashalgo is None:
+            hashalgo = hashlib.sha1
+
+        if path is not None:
+            import mmap
+            import stat
+
+            with open(path, 'rb') as fh:
+                st = os.fstat(fh.fileno())
+                if stat.S_ISREG(st.st_mode) and st.st_size > 0:
+                    hashobj = hashalgo()
+                    with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        hashobj.update(mm)
+                else:
+                    # Pipes, devices and empty files cannot be mapped
+                    hashobj = hashlib.file_digest(fh, hashalgo)
+            return hashobj.hexdigest()
+
         hashobj = hashalgo()
         if data is None:
             data = bytes(self.date().isoformat(), 'utf-8')
@@ -186,38 +362,89 @@ class UtilPysh:
 
 
 class Filesys:
+    __slots__ = ('_script', '_assetsdir', 'scriptname', '_made_dirs', '_sudo', '_sudo_pending')
+
     def __init__(self, asset_root):
         """Create a filesystem helper using `topfile` path as the root for assets
         """
         self._script = pathlib.Path(asset_root)
         self._assetsdir = self._script.parent
         self.scriptname = self._script.name
+        self._made_dirs:set[str] = set()
+        self._sudo = None
+        self._sudo_pending:list[str] = []
 
 
     def tempfile(self, dir_abspath=None) -> str:
         """ Create a temp file.
 
         If dir is specified, makes the temp file in that directory
-        If text is set to False,
         """
-        if dir_abspath:
-            self.makedirs(dir_abspath)
-        _, name = tempfile.mkstemp(dir=dir_abspath)
+        fd, name = self._mkstemp(dir_abspath)
+        os.close(fd)
         return name
 
 
+    def _mkstemp(self, dir_abspath=None) -> tuple[int,str]:
+        import tempfile
+
+        if dir_abspath:
+            self._make_dir(dir_abspath, 511)
+        return tempfile.mkstemp(dir=dir_abspath)
+
+
     def cp(self, src, dst, dirmode=511):
         """ Make parent directories, and copy a file to destination
         """
-        os.makedirs(pathlib.Path(dst).parent, exist_ok=True, mode=dirmode)
-        shutil.copy(src, dst)
+        import shutil
+
+        self._into_parent(shutil.copy, src, dst, dirmode)
+
+
+    def cp_many(self, pairs, dirmode=511, copymode=True):
+        """ Copy each `(src, dst)` pair, making all the needed parent directories up front
+
+        If `copymode` is False, only file contents are copied, not permission bits
+        """
+        import shutil
+
+        pairs = list(pairs)
+        for parent in {os.path.dirname(os.path.abspath(dst)) for _, dst in pairs}:
+            self._make_dir(parent, dirmode)
+
+        copy = shutil.copy if copymode else shutil.copyfile
+        for src, dst in pairs:
+            self._into_parent(copy, src, dst, dirmode)
 
 
     def mv(self, src, dst, dirmode=511):
         """ Make parent directories, and move a file to destination
         """
-        os.makedirs(pathlib.Path(dst).parent, exist_ok=True, mode=dirmode)
-        shutil.move(src, dst)
+        import shutil
+
+        self._into_parent(shutil.move, src, dst, dirmode)
+
+
+    def _into_parent(self, op, src, dst, dirmode):
+        """ Run `op(src, dst)` after making the parent directory of `dst`
+        """
+        parent = os.path.dirname(os.path.abspath(dst))
+        self._make_dir(parent, dirmode)
+        try:
+            op(src, dst)
+        except FileNotFoundError:
+            # The directory may have been removed since this helper made it: make it again, retry once
+            self._made_dirs.discard(parent)
+            self._make_dir(parent, dirmode)
+            op(src, dst)
+
+
+    def _make_dir(self, dirpath, dirmode):
+        """ Make a directory and its parents, skipping directories already made by this helper
+        """
+        if dirpath not in self._made_dirs:
+            os.makedirs(dirpath, exist_ok=True, mode=dirmode)
+            self._made_dirs.add(dirpath)
 
 
     def asset_path(self, path='') -> pathlib.Path:
@@ -251,28 +478,136 @@ class Filesys:
         :param substitutions: key-value substitutions
         """
         with open(filepath) as fh:
-            text = ''.join(fh.readlines())
+            text = fh.read()
 
-        for k,v in substitutions.items():
-            text = text.replace(f"%{k}%", v)
+        if not substitutions:
+            return text
 
-        return text
+        pattern = re.compile("%(" + "|".join(re.escape(k) for k in substitutions) + ")%")
+        return pattern.sub(lambda m: substitutions[m.group(1)], text)
 
 
     def sudo_write(self, filepath, data, mode='w'):
         """ Write a file to a protected location
+
+        Raises subprocess.CalledProcessError if the file could not be moved into place.
+
+        Inside a `sudo_session()`, the file is only queued: it is moved into place by the
+        session's shell, at the latest when the block exits, and failures are reported then.
         """
-        filename = self.tempfile()
-        with open(filename, mode) as fh:
-            fh.write(data)
-        os.system(f"sudo mv {filename} {filepath}")
+        import subprocess
+
+        fd, filename = self._mkstemp()
+        try:
+            with os.fdopen(fd, mode) as fh:
+                fh.write(data)
+
+            if self._sudo is None:
+                subprocess.run(["sudo", "mv", "--", filename, filepath], check=True)
+            else:
+                self._sudo_queue(filename, filepath)
+
+        except BaseException:
+            # The file was neither moved nor queued, do not leave its data behind
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            raise
+
+
+    def _sudo_queue(self, filename, filepath):
+        import shlex
+        import subprocess
+
+        src, dst = shlex.quote(filename), shlex.quote(os.fspath(filepath))
+        try:
+            self._sudo.stdin.write(f"mv -- {src} {dst} || {{ rm -f -- {src}; exit 1; }}\n")
+            self._sudo.stdin.flush()
+        except BrokenPipeError:
+            # The session shell already exited, after an earlier failure
+            raise subprocess.CalledProcessError(self._sudo.wait(), self._sudo.args) from None
+        self._sudo_pending.append(filename)
+
+
+    @contextlib.contextmanager
+    def sudo_session(self):
+        """ Run all `sudo_write()` calls of the block through a single `sudo sh` process
+
+        sudo is invoked, and may ask for a password, once for the whole block instead of once per write.
+        The writes are deferred: a file is not guaranteed to be in place until the block exits.
+
+        e.g.
+            with FS.sudo_session():
+                FS.sudo_write("/etc/myapp/main.conf", main_conf)
+                FS.sudo_write("/etc/myapp/extra.conf", extra_conf)
+
+        Raises subprocess.CalledProcessError at the end of the block if any of the writes failed.
+        Writes queued after a failure are not performed, and their temp files are removed.
+        """
+        import subprocess
+
+        proc = subprocess.Popen(["sudo", "sh", "-e"], stdin=subprocess.PIPE, text=True)
+        self._sudo = proc
+        try:
+            yield
+        finally:
+            self._sudo = None
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            status = proc.wait()
+
+            # Moved files are gone from the temp dir; anything left was never moved
+            for filename in self._sudo_pending:
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
+            self._sudo_pending = []
+
+        if status != 0:
+            raise subprocess.CalledProcessError(status, proc.args)
+
+
+    def stat_or_none(self, path) -> os.stat_result|None:
+        """ Return the stat result of a path, or None if it does not exist
+
+        Use this to check several properties of a path with a single stat call, e.g.
+
+            st = FS.stat_or_none(path)
+            if st is None:
+                ...
+            elif stat.S_ISDIR(st.st_mode):
+                ...
+        """
+        try:
+            return os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+
+    def exists(self, path) -> bool:
+        return os.path.exists(path)
+
+
+    def isfile(self, path) -> bool:
+        return os.path.isfile(path)
+
+
+    def isdir(self, path) -> bool:
+        return os.path.isdir(path)
 
 
     def glob(self, pat) -> list[str]:
+        import glob
         return glob.glob(pat)
 
 
 class Color:
+    __slots__ = ('_colors',)
+
     def __init__(self):
         noclr = os.getenv("NO_COLOR", "0") == "1"
         colors = {
@@ -295,15 +630,21 @@ class Color:
         print(self.clr(color, text))
 
 
+_YES = frozenset(("y", "yes"))
+_NO = frozenset(("n", "no"))
+_YESNO = _YES | _NO
+
 class User:
     """ Prompt user and display information. Uses Color class.
     """
+    __slots__ = ()
+
     def read_user(self, prompt) -> str:
         """ Ask a user for input
+
+        Raises EOFError if input is closed before a line is read
         """
-        print(prompt, end='', flush=True)
-        res = sys.stdin.readline()
-        return res.strip("\n")
+        return input(prompt)
 
     def ask(self, prompt) -> str:
         return self.read_user(Color().clr("BLUE", prompt))
@@ -313,10 +654,11 @@ class User:
         """ Ask a user for a yes/no response as 'y' or 'yes'
         Return True if y/yes , False if n/no, or ask again if neither.
         """
+        prompt = f"{Color().clr("TEAL", prompt)} y/N> "
         res = ""
-        while res.lower() not in ["y", "yes", "no", "n"]:
-            res = self.read_user(f"{Color().clr("TEAL", prompt)} y/N> ")
-        return res.lower() in ["yes", "y"]
+        while res not in _YESNO:
+            res = self.read_user(prompt).lower()
+        return res in _YES
 
 
     def choose(self, prompt, options):
@@ -326,10 +668,7 @@ class User:
 
         Raises ValueError if user entered non-int or value out of range
         """
-        i = 1
-        for item in options:
-            print(f"  {i}: {item}")
-            i+=1
+        sys.stdout.write("".join(f"  {i}: {item}\n" for i, item in enumerate(options, 1)))
 
         res = self.read_user(Color().clr("TEAL", prompt))
         res = int(res)
@@ -342,15 +681,19 @@ class User:
     def name(self) -> str|None:
         """ Return the current user name
         """
-        return os.getenv("USERNAME")
+        return _env_cached("USERNAME")
 
 
     def uid(self) -> int:
         """ Return the current user ID
         """
-        return int(os.getenv("UID", -1))
+        if hasattr(os, "getuid"):
+            return os.getuid()
+        return int(_env_cached("UID", -1))
 
 class LineHandler:
+    __slots__ = ('_data',)
+
     def __init__(self, data:str|list[str]):
         if isinstance(data, str):
             data = data.split("\n")
@@ -381,6 +724,31 @@ class LineHandler:
         else:
             return LineHandler([line.replace(target, replacement) for line in self._data])
 
+_NEGATIVE_NUMBER = re.compile(r"^-\d+$|^-\d*\.\d+$")
+
+def _long_flag(flag:str) -> tuple[str,str]:
+    """ Normalize a flag to the 2-dash convention, and return it with its attribute name
+    """
+    name = flag.lstrip("-/")
+    dest = name.replace("-", "_") if "-" in name else name
+    return f"--{name}", dest
+
+
+def _metavar(name:str, choices) -> str:
+    """ Display name of an argument value in usage and help: its choices if any, as argparse does
+    """
+    if choices is None:
+        return name
+    return "{" + ",".join(str(c) for c in choices) + "}"
+
+
+class Namespace(SimpleNamespace):
+    """ Parsed arguments, as attributes. Like `argparse.Namespace`, supports `"name" in args`
+    """
+    def __contains__(self, key):
+        return key in self.__dict__
+
+
 class ArgumentParser:
     """
     A quick-spec argument parser.
@@ -389,28 +757,49 @@ class ArgumentParser:
         parser.positionals("arg1", "arg2", "arg3")
         args = parser.parse()
         print(args.arg2)
+
+    Arguments declared with `args()`, `moreargs()`, `flags()` and `options()` are parsed in a single
+    pass, without loading `argparse`, into a `Namespace`. Calling `add_argument()`, or passing any
+    argparse setting other than `description`, switches the parser over to a full
+    `argparse.ArgumentParser` backend.
     """
+    __slots__ = ('_prog', '_parser_kwargs', '_parser', '_flags', '_opts', '_pos', '_registered')
+
     def __init__(self, command_leadup=None, **k):
-        self._parser = argparse.ArgumentParser(command_leadup, **k)
+        self._prog = command_leadup
+        self._parser_kwargs = k
+        self._parser = None
+
+        self._flags:dict[str,str] = {} # "--flag" -> dest
+        self._opts:dict[str,tuple[str,Any,type,tuple|None]] = {} # "--opt" -> (dest, default, type, choices)
+        self._pos:list[tuple[str,list[str]|None,str|None,str|None]] = [] # (name, choices, nargs, help)
+        self._registered:list[tuple[tuple,dict]] = [] # replayed onto argparse if it is needed
+
+        if k.keys() - {"description"}:
+            # parents, prefix_chars, add_help, exit_on_error... are only honoured by argparse
+            self._use_argparse()
 
 
     def parse(self, argv):
         """ Parse arguments as currently defined
         """
         assert argv is not None, f"Use parse parse_argv() to parse top-level command line arguments"
-        return self._parser.parse_args(argv)
+        if self._parser is not None:
+            return self._parser.parse_args(argv)
+        return self._parse(argv)
 
 
     def parse_argv(self):
         """ Parse system command line arguments
         """
-        return self._parser.parse_args()
+        return self.parse(sys.argv[1:])
 
 
     def add_argument(self, *a, **k):
         """ Add a raw argument to the parser. See argparse.ArgumentParser.add_argument(...)
         """
-        self._parser.add_argument(*a, **k)
+        self._use_argparse()
+        self._register(*a, **k)
 
 
     def args(self, *names, **choices:list[str]):
@@ -419,11 +808,13 @@ class ArgumentParser:
         For positional arguments with a value list, this constrains the discrete available choices
         """
         for name in names:
-            self._parser.add_argument(name)
+            self._register(name)
+            self._pos.append((name, None, None, None))
 
         for k,v in choices.items():
             if isinstance(v, list):
-                self._parser.add_argument(k, choices=v)
+                self._register(k, choices=v)
+                self._pos.append((k, v, None, None))
             else:
                 raise ValueError(f"Positional {repr(k)} must take a list of choices, not {repr(v)}")
 
@@ -432,15 +823,20 @@ class ArgumentParser:
 
         Use `nargs="+"` to specify one or more ; use `nargs="*"` to specify zero or more
         """
-        self.add_argument(name, nargs=nargs, help=help)
+        if nargs not in ("+", "*", "?") or any(p[2] for p in self._pos):
+            self._use_argparse()
+        self._register(name, nargs=nargs, help=help)
+        self._pos.append((name, None, nargs, help))
 
 
     def flags(self, *flags:str):
         """ Add boolean flags. During runtime, unset flags are false, set flags are true
         """
+        register = self._register
         for flag in flags:
-            flag = f"--{flag.lstrip("-/")}" # force 2-dash convention
-            self._parser.add_argument(flag, action="store_true")
+            flag, dest = _long_flag(flag)
+            register(flag, action="store_true")
+            self._flags[flag] = dest
 
 
     def options(self, **opts:Any):
@@ -451,19 +847,184 @@ class ArgumentParser:
         If the default value of an item is a tuple, this indicates a set of fixed choices, and the default value will be the first in the tuple.
         """
         defval:tuple|Any
+        register = self._register
         for flag, defval in opts.items():
-            flag = f"--{flag.lstrip("-/")}" # force 2-dash convention
+            flag, dest = _long_flag(flag)
 
             if isinstance(defval, tuple):
-                self._parser.add_argument(flag, default=defval[0], choices=defval, type=type(defval[0]))
+                register(flag, default=defval[0], choices=defval, type=type(defval[0]))
+                self._opts[flag] = (dest, defval[0], type(defval[0]), defval)
+            else:
+                register(flag, default=defval, type=type(defval))
+                self._opts[flag] = (dest, defval, type(defval), None)
+
+
+    def _register(self, *a, **k):
+        self._registered.append((a, k))
+        if self._parser is not None:
+            self._parser.add_argument(*a, **k)
+
+
+    def _use_argparse(self):
+        """ Switch to a full argparse backend, for argument shapes the quick parser does not handle
+        """
+        if self._parser is None:
+            import argparse
+            self._parser = argparse.ArgumentParser(self._prog, **self._parser_kwargs)
+            for a, k in self._registered:
+                self._parser.add_argument(*a, **k)
+
+
+    def _parse(self, argv) -> 'Namespace':
+        values:dict[str,Any] = {dest:False for dest in self._flags.values()}
+        for dest, defval, _, _ in self._opts.values():
+            values[dest] = defval
+
+        positionals = []
+        tokens = iter(argv)
+        for tok in tokens:
+            if tok == "--":
+                positionals.extend(tokens)
+                break
+
+            elif tok == "-h":
+                self._exit_help()
+
+            elif tok.startswith("--"):
+                name, eq, value = tok.partition("=")
+                name = self._match_long(name)
+                if name == "--help":
+                    self._exit_help()
+
+                elif name in self._flags:
+                    if eq:
+                        self._error(f"argument {name}: ignored explicit argument {repr(value)}")
+                    values[self._flags[name]] = True
+
+                elif name in self._opts:
+                    dest, _, typ, choices = self._opts[name]
+                    if not eq:
+                        value = next(tokens, None)
+                        if value is None or value.startswith("-") and value != "-" and not _NEGATIVE_NUMBER.match(value):
+                            self._error(f"argument {name}: expected one argument")
+                    try:
+                        value = typ(value)
+                    except (TypeError, ValueError):
+                        self._error(f"argument {name}: invalid {typ.__name__} value: {repr(value)}")
+                    self._check_choice(name, value, choices)
+                    values[dest] = value
+
+                else:
+                    self._error(f"unrecognized arguments: {tok}")
+
+            elif tok.startswith("-") and tok != "-" and not _NEGATIVE_NUMBER.match(tok):
+                self._error(f"unrecognized arguments: {tok}")
+
+            else:
+                positionals.append(tok)
+
+        self._assign_positionals(positionals, values)
+        return Namespace(**values)
+
+
+    def _match_long(self, name:str) -> str:
+        """ Resolve a long option from its full name, or from a unique prefix of it, as argparse does
+        """
+        if name in self._flags or name in self._opts:
+            return name
+
+        candidates = [known for known in (*self._flags, *self._opts, "--help") if known.startswith(name)]
+        if len(candidates) > 1:
+            self._error(f"ambiguous option: {name} could match {', '.join(candidates)}")
+        return candidates[0] if candidates else name
+
+
+    def _exit_help(self):
+        sys.stdout.write(self._help())
+        sys.exit(0)
+
+
+    def _assign_positionals(self, positionals:list[str], values:dict[str,Any]):
+        required = [p[0] for p in self._pos if p[2] in (None, "+")]
+        if len(positionals) < len(required):
+            self._error(f"the following arguments are required: {', '.join(required[len(positionals):])}")
+
+        spare = len(positionals) - sum(1 for p in self._pos if p[2] is None)
+        i = 0
+        for name, choices, nargs, _ in self._pos:
+            if nargs is None:
+                self._check_choice(name, positionals[i], choices)
+                values[name] = positionals[i]
+                i += 1
+            elif nargs == "?":
+                values[name] = positionals[i] if spare else None
+                i += min(spare, 1)
             else:
-                self._parser.add_argument(flag, default=defval, type=type(defval))
+                values[name] = positionals[i:i+spare]
+                i += spare
+
+        if i < len(positionals):
+            self._error(f"unrecognized arguments: {' '.join(positionals[i:])}")
+
+
+    def _check_choice(self, name, value, choices):
+        if choices is not None and value not in choices:
+            options = ', '.join(repr(c) for c in choices)
+            self._error(f"argument {name}: invalid choice: {repr(value)} (choose from {options})")
+
+
+    def _prog_name(self) -> str:
+        return self._prog or os.path.basename(sys.argv[0])
+
+
+    def _usage(self) -> str:
+        tokens = ["usage:", self._prog_name(), "[-h]"]
+        tokens += [f"[{flag}]" for flag in self._flags]
+        tokens += [f"[{flag} {_metavar(dest.upper(), choices)}]" for flag, (dest, _, _, choices) in self._opts.items()]
+        for name, choices, nargs, _ in self._pos:
+            spec = _metavar(name, choices)
+            if nargs == "+":
+                spec = f"{spec} [{spec} ...]"
+            elif nargs == "*":
+                spec = f"[{spec} ...]"
+            elif nargs == "?":
+                spec = f"[{spec}]"
+            tokens.append(spec)
+        return " ".join(tokens)
+
+
+    def _help(self) -> str:
+        lines = [self._usage(), ""]
+        if description := self._parser_kwargs.get("description"):
+            lines += [description, ""]
+
+        if self._pos:
+            lines.append("positional arguments:")
+            lines += [f"  {_metavar(name, choices)}" + (f"  {help}" if help else "") for name, choices, _, help in self._pos]
+            lines.append("")
+
+        lines.append("options:")
+        lines.append("  -h, --help  show this help message and exit")
+        lines += [f"  {flag}" for flag in self._flags]
+        lines += [
+            f"  {flag} {_metavar(dest.upper(), choices)}  (default: {defval})"
+            for flag, (dest, defval, _, choices) in self._opts.items()
+            ]
+        return "\n".join(lines) + "\n"
+
+
+    def _error(self, message):
+        sys.stderr.write(f"{self._usage()}\n{self._prog_name()}: error: {message}\n")
+        sys.exit(2)
 
 
 
 class Time:
+    __slots__ = ('_thetime',)
 
     def __init__(self, dtspec=None):
+        from datetime import datetime
+
         if dtspec is None:
             self._thetime = datetime.now()
         else:
@@ -471,6 +1032,7 @@ class Time:
 
 
     def sleep(self, duration):
+        import time
         time.sleep(duration)
 
 
@@ -478,5 +1040,5 @@ class Time:
         return self._thetime
 
 
-    def seconds_since(self, date:datetime):
+    def seconds_since(self, date:'datetime'):
         return (self._thetime - date).total_seconds()